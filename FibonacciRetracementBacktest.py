@@ -1,29 +1,126 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import yfinance as yf
+import plotly.graph_objects as go
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import io
+import multiprocessing
 from datetime import datetime, timedelta
 import traceback  # For detailed error tracing
 
+from backtest_engine import (
+    add_indicators,
+    build_transactions,
+    download_prices,
+    run_backtest,
+    run_one,
+    strategy_arrays,
+    sweep_swing_lengths,
+)
+
+
+@st.cache_data(ttl=3600)
+def load_prices(symbol, start, end):
+    """Download daily prices from Yahoo Finance, cached per symbol and date range."""
+    return download_prices(symbol, start, end)
+
+
+@st.cache_data(ttl=3600, max_entries=64)
+def compute_indicators(prices, swing_length):
+    """Add swing highs/lows and the Fib50 level, cached per price frame and swing length."""
+    return add_indicators(prices, swing_length)
+
+
+@st.cache_data(ttl=3600, max_entries=64)
+def run_backtest_cached(indicators, starting_balance, risk_percent):
+    """Run the compiled backtest on (close, high, fib50, swing_high) arrays, cached per parameter set."""
+    close, high, fib50, swing_high = indicators
+    return run_backtest(close, high, fib50, swing_high, float(starting_balance), risk_percent / 100)
+
+
+@st.cache_data(ttl=3600, max_entries=64)
+def sweep_swing_lengths_cached(prices, swing_lengths, starting_balance, risk_percent):
+    """Backtest every swing length in one parallel pass, cached per parameter set."""
+    return sweep_swing_lengths(prices, swing_lengths, starting_balance, risk_percent)
+
+
+@st.cache_data(ttl=3600)
+def run_symbols(symbols, start, end, swing_length, starting_balance, risk_percent):
+    """Download and backtest several symbols in parallel worker processes."""
+    # Spawn fresh workers: forking the threaded Streamlit server (and Numba's thread pool) can deadlock
+    with multiprocessing.get_context("spawn").Pool(min(8, len(symbols))) as pool:
+        return pool.starmap(
+            run_one, [(s, start, end, swing_length, starting_balance, risk_percent) for s in symbols]
+        )
+
+
 # Streamlit App Title
 st.title("Fibonacci Retracement Backtesting Program")
 
 # User Inputs: Stock Symbol, Date Range, Starting Balance, and Risk Percentage
 st.sidebar.header("Input Parameters")
 symbol = st.sidebar.text_input("Enter Stock Symbol (e.g., AAPL, MSFT):", value="AAPL")
+symbols = [s.strip() for s in symbol.split(",") if s.strip()]
 start_date = st.sidebar.date_input("Start Date", value=datetime.now() - timedelta(days=365))
 end_date = st.sidebar.date_input("End Date", value=datetime.now())
 starting_balance = st.sidebar.number_input("Starting Account Balance ($)", value=10000, min_value=1000, step=100)
 risk_percent = st.sidebar.number_input("Percentage of Account for Each Trade (%)", value=5.0, min_value=1.0, max_value=100.0)
 
+# Strategy Parameters
+swing_length = st.sidebar.slider("Swing Length", min_value=5, max_value=50, value=10)
+
+# The sweep and the signal log only apply to a single symbol
+sweep_lengths = st.sidebar.multiselect(
+    "Sweep Swing Lengths", options=list(range(5, 51)), default=[],
+    disabled=len(symbols) > 1, help="Applies when a single symbol is entered.",
+)
+debug_mode = st.sidebar.checkbox(
+    "Debug", value=False, disabled=len(symbols) > 1, help="Applies when a single symbol is entered.",
+)
+
 # Debug Info for Inputs
 st.write("Debug Info:")
 st.write(f"Symbol: {symbol}, Start Date: {start_date}, End Date: {end_date}")
 st.write(f"Starting Balance: ${starting_balance}, Risk Percentage: {risk_percent}%")
 
 # Fetch Historical Data
+# The button only arms the pipeline; later widget changes rerun it from the cached stages
 if st.button("Fetch Data"):
+    st.session_state["data_requested"] = True
+
+if st.session_state.get("data_requested") and len(symbols) > 1:
+    try:
+        if sweep_lengths or debug_mode:
+            st.info("Sweep Swing Lengths and Debug apply to a single symbol only and are ignored for multiple symbols.")
+
+        st.write(f"Backtesting {len(symbols)} symbols in parallel...")
+        results = run_symbols(
+            symbols, pd.Timestamp(start_date), pd.Timestamp(end_date), swing_length, starting_balance, risk_percent
+        )
+
+        # Summary per symbol
+        st.subheader("Summary by Symbol")
+        summary_df = pd.DataFrame({
+            "Symbol": symbols,
+            "Trades": [len(transactions) for transactions, _ in results],
+            "Ending Balance": [ending_balance for _, ending_balance in results],
+        })
+        summary_df["Total P/L"] = summary_df["Ending Balance"] - starting_balance
+        st.dataframe(summary_df)
+
+        for sym, (transactions, _) in zip(symbols, results):
+            with st.expander(f"{sym} Transaction Details"):
+                if transactions.empty:
+                    st.warning("No transactions were executed based on the selected parameters.")
+                else:
+                    st.dataframe(transactions)
+
+    except Exception as e:
+        st.error(f"An unexpected error occurred: {e}")
+        st.write(traceback.format_exc())
+
+elif st.session_state.get("data_requested"):
     try:
         # Convert dates to datetime for yfinance compatibility
         start_date = pd.Timestamp(start_date)
@@ -31,20 +128,10 @@ if st.button("Fetch Data"):
 
         st.write(f"Fetching data for {symbol} from {start_date} to {end_date}...")
 
-        # Fetch data from Yahoo Finance
-        data = yf.download(symbol, start=start_date, end=end_date)
+        # Fetch data from Yahoo Finance (cached per symbol and date range)
+        data = load_prices(symbol, start_date, end_date)
         st.write("Data fetched successfully.")
 
-        # Flatten MultiIndex columns if they exist
-        if isinstance(data.columns, pd.MultiIndex):
-            data.columns = [col[0] for col in data.columns]  # Use the first level of the MultiIndex
-            st.write("Flattened MultiIndex columns:")
-            st.write(data.columns)
-
-        # Reset index to make Date a column
-        data.reset_index(inplace=True)
-        data.rename(columns={"Adj Close": "Close"}, inplace=True)
-
         # Validate Data
         if data.empty:
             st.error("No data found for the selected symbol and date range.")
@@ -59,9 +146,6 @@ if st.button("Fetch Data"):
 
         st.write("Data validation passed.")
 
-        # Strategy Parameters
-        swing_length = st.slider("Swing Length", min_value=5, max_value=50, value=10)
-
         # Validate Dataset Size
         st.write("Dataset size:", len(data))
         st.write("Swing length:", swing_length)
@@ -71,9 +155,8 @@ if st.button("Fetch Data"):
 
         st.write("Calculating swing highs, lows, and Fibonacci levels...")
 
-        # Calculate Swing Highs and Lows
-        data["SwingHigh"] = data["High"].rolling(window=swing_length, center=True).max()
-        data["SwingLow"] = data["Low"].rolling(window=swing_length, center=True).min()
+        # Calculate Swing Highs, Lows and Fibonacci levels (cached per swing length)
+        data = compute_indicators(data, swing_length)
 
         # Validate SwingHigh and SwingLow
         st.write("Validating SwingHigh and SwingLow columns...")
@@ -85,86 +168,39 @@ if st.button("Fetch Data"):
         st.write("SwingHigh and SwingLow columns after rolling calculations:")
         st.write(data[["SwingHigh", "SwingLow"]].head())
 
-        # Fibonacci Levels Calculation
-        data["Fib38"] = data["SwingHigh"] - (data["SwingHigh"] - data["SwingLow"]) * 0.382
-        data["Fib50"] = data["SwingHigh"] - (data["SwingHigh"] - data["SwingLow"]) * 0.5
-        data["Fib61"] = data["SwingHigh"] - (data["SwingHigh"] - data["SwingLow"]) * 0.618
-
-        # Validate Fibonacci Levels
-        st.write("Validating Fibonacci levels...")
-        missing_fibs = data[["Fib38", "Fib50", "Fib61"]].isnull().all()
-        if missing_fibs.any():
-            st.error("Fibonacci levels contain only NaN values. Please adjust your swing length or dataset.")
-            st.stop()
+        # Debug: Check the Fibonacci level used by the strategy
+        st.write("Fib50 column after calculations:")
+        st.write(data[["Fib50"]].head())
 
-        # Debug: Check for NaN in Fibonacci levels
-        st.write("Fibonacci level columns after calculations:")
-        st.write(data[["Fib38", "Fib50", "Fib61"]].head())
-
-        # Drop rows with NaN values in required columns
+        # Hoist the strategy columns into plain ndarrays, dropping rows with NaN indicators
         st.write("Dropping rows with NaN values in Fib50, SwingHigh, and SwingLow...")
-        data.dropna(subset=["Fib50", "SwingHigh", "SwingLow"], inplace=True)
+        valid, close_arr, high_arr, fib50_arr, swing_high_arr, date_arr = strategy_arrays(data)
         st.write("Rows with NaN values dropped. DataFrame preview:")
-        st.write(data.head())
+        st.write(data.iloc[np.flatnonzero(valid)[:5]])
 
         # Backtesting Logic
-        account_balance = starting_balance
-        total_pnl = 0
-        total_pnl_percent = 0
-        transactions = []
-
         st.write("Starting backtesting...")
 
-        for i in range(len(data)):
-            # Entry Signal
-            if (
-                i > 0 and
-                data.iloc[i]["Close"] > data.iloc[i]["Fib50"] and
-                data.iloc[i - 1]["Close"] <= data.iloc[i]["Fib50"]
+        trades = run_backtest_cached((close_arr, high_arr, fib50_arr, swing_high_arr), starting_balance, risk_percent)
+        transactions_df = build_transactions(date_arr, starting_balance, *trades)
+
+        n_trades = len(transactions_df)
+        account_balance = transactions_df["Account Balance"].iloc[-1] if n_trades else starting_balance
+        total_pnl = transactions_df["Total P/L"].iloc[-1] if n_trades else 0
+        total_pnl_percent = transactions_df["Total P/L (%)"].iloc[-1] if n_trades else 0
+
+        # Debugging: Log entry and exit signals in a single element instead of one write per trade
+        if debug_mode and n_trades:
+            signal_log = []
+            for entry_date, exit_date, entry_price, exit_price in zip(
+                transactions_df["Entry Date"], transactions_df["Exit Date"],
+                transactions_df["Entry Price"], transactions_df["Exit Price"],
             ):
-                # Calculate position size
-                position_size = (risk_percent / 100) * account_balance
-                shares = position_size / data.iloc[i]["Close"]
-                entry_price = data.iloc[i]["Close"]
-                entry_date = data.iloc[i]["Date"]
-
-                # Debugging: Log entry signal
-                st.write(f"Entry signal triggered on {entry_date} at {entry_price:.2f}")
-
-                # Exit Signal: Sell when reaching Swing High
-                for j in range(i + 1, len(data)):
-                    if data.iloc[j]["High"] >= data.iloc[j]["SwingHigh"]:
-                        exit_price = data.iloc[j]["SwingHigh"]
-                        exit_date = data.iloc[j]["Date"]
-                        pnl = (exit_price - entry_price) * shares
-                        pnl_percent = (pnl / (entry_price * shares)) * 100
-
-                        # Update account balance
-                        account_balance += pnl
-                        total_pnl += pnl
-                        total_pnl_percent += pnl_percent
-
-                        # Record transaction
-                        transactions.append({
-                            "Entry Date": entry_date,
-                            "Exit Date": exit_date,
-                            "Entry Price": entry_price,
-                            "Exit Price": exit_price,
-                            "Shares Bought": shares,
-                            "Shares Sold": shares,
-                            "P/L": pnl,
-                            "P/L (%)": pnl_percent,
-                            "Total P/L": total_pnl,
-                            "Total P/L (%)": total_pnl_percent,
-                            "Account Balance": account_balance,
-                        })
-
-                        # Debugging: Log exit signal
-                        st.write(f"Exit signal triggered on {exit_date} at {exit_price:.2f}")
-                        break
+                signal_log.append(f"Entry signal triggered on {entry_date} at {entry_price:.2f}")
+                signal_log.append(f"Exit signal triggered on {exit_date} at {exit_price:.2f}")
+            st.text_area("Signal Log", "\n".join(signal_log), height=200)
 
         # Handle Empty Transactions
-        transactions_df = pd.DataFrame(transactions)
         if transactions_df.empty:
             st.warning("No transactions were executed based on the selected parameters.")
         else:
@@ -172,32 +208,44 @@ if st.button("Fetch Data"):
             st.subheader("Transaction Details")
             st.dataframe(transactions_df)
 
-            # Download CSV
+            # Download CSV (written by Arrow's C++ CSV writer). Dates are cast to date32 and the
+            # header is left unquoted so the file matches what DataFrame.to_csv produced.
+            csv_table = pa.Table.from_pandas(transactions_df, preserve_index=False)
+            for col in ["Entry Date", "Exit Date"]:
+                csv_table = csv_table.set_column(
+                    csv_table.schema.get_field_index(col), col, csv_table[col].cast(pa.date32())
+                )
+            csv_buffer = io.BytesIO()
+            pacsv.write_csv(csv_table, csv_buffer, pacsv.WriteOptions(quoting_header="none"))
             st.download_button(
                 label="Download Transactions CSV",
-                data=transactions_df.to_csv(index=False),
+                data=csv_buffer.getvalue(),
                 file_name="transactions.csv",
                 mime="text/csv",
             )
 
             # Plot P/L and Account Balance
             st.subheader("Performance Chart")
-            fig, ax1 = plt.subplots(figsize=(10, 6))
+            fig = go.Figure()
 
             # P/L over time
-            ax1.plot(transactions_df["Entry Date"], transactions_df["Total P/L"], label="Total P/L", color="green")
-            ax1.set_xlabel("Date")
-            ax1.set_ylabel("Total P/L ($)", color="green")
-            ax1.tick_params(axis="y", labelcolor="green")
+            fig.add_trace(go.Scatter(
+                x=transactions_df["Entry Date"], y=transactions_df["Total P/L"],
+                name="Total P/L", line=dict(color="green"),
+            ))
 
             # Account balance over time
-            ax2 = ax1.twinx()
-            ax2.plot(transactions_df["Entry Date"], transactions_df["Account Balance"], label="Account Balance", color="blue")
-            ax2.set_ylabel("Account Balance ($)", color="blue")
-            ax2.tick_params(axis="y", labelcolor="blue")
-
-            fig.tight_layout()
-            st.pyplot(fig)
+            fig.add_trace(go.Scatter(
+                x=transactions_df["Entry Date"], y=transactions_df["Account Balance"],
+                name="Account Balance", line=dict(color="blue"), yaxis="y2",
+            ))
+
+            fig.update_layout(
+                xaxis=dict(title="Date"),
+                yaxis=dict(title="Total P/L ($)", color="green"),
+                yaxis2=dict(title="Account Balance ($)", color="blue", overlaying="y", side="right"),
+            )
+            st.plotly_chart(fig, use_container_width=True)
 
             # Summary
             st.subheader("Summary")
@@ -206,6 +254,24 @@ if st.button("Fetch Data"):
             st.write(f"Total P/L: ${total_pnl:.2f}")
             st.write(f"Total P/L (%): {total_pnl_percent:.2f}%")
 
+        # Parameter Sweep across the selected swing lengths
+        if sweep_lengths:
+            st.subheader("Swing Length Sweep")
+            sweep_lengths = sorted(sweep_lengths)
+            ending_balances = sweep_swing_lengths_cached(
+                load_prices(symbol, start_date, end_date), sweep_lengths, starting_balance, risk_percent
+            )
+            sweep_df = pd.DataFrame({"Swing Length": sweep_lengths, "Ending Balance": ending_balances})
+            st.dataframe(sweep_df)
+
+            fig = go.Figure(go.Scatter(
+                x=sweep_df["Swing Length"], y=sweep_df["Ending Balance"],
+                mode="lines+markers", name="Ending Balance", line=dict(color="blue"),
+            ))
+            fig.add_hline(y=starting_balance, line_dash="dash", line_color="gray", annotation_text="Starting Balance")
+            fig.update_layout(xaxis=dict(title="Swing Length"), yaxis=dict(title="Ending Balance ($)"))
+            st.plotly_chart(fig, use_container_width=True)
+
     except Exception as e:
         st.error(f"An unexpected error occurred: {e}")
         st.write(traceback.format_exc())
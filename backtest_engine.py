@@ -0,0 +1,238 @@
+"""Streamlit-free core of the Fibonacci retracement backtest.
+
+Kept importable on its own so multiprocessing workers can run whole backtests.
+"""
+import pandas as pd
+import numpy as np
+import bottleneck as bn
+import numexpr as ne
+import yfinance as yf
+from numba import njit, prange
+
+
+def centered_move(move_func, values, window):
+    """Apply a bottleneck moving-window function with pandas rolling(center=True) alignment."""
+    out = np.full(len(values), np.nan, dtype=values.dtype)
+    if window > len(values):
+        return out
+    offset = (window - 1) // 2
+    out[: len(values) - offset] = move_func(values, window=window)[offset:]
+    return out
+
+
+@njit(cache=True)
+def pack_mask(mask):
+    """Pack a boolean mask into uint64 words, bar k going to bit k % 64 of word k // 64."""
+    words = np.zeros((len(mask) + 63) // 64, dtype=np.uint64)
+    for k in range(len(mask)):
+        words[k >> 6] |= np.uint64(mask[k]) << np.uint64(k & 63)
+    return words
+
+
+@njit(cache=True)
+def unpack_indices(words):
+    """Return the bar indices of the set bits in packed mask words, in ascending order."""
+    out = np.empty(len(words) * 64, dtype=np.int64)
+    n = 0
+    for w in range(len(words)):
+        word = words[w]
+        bit = 0
+        while word != 0:
+            if word & np.uint64(1):
+                out[n] = w * 64 + bit
+                n += 1
+            word >>= np.uint64(1)
+            bit += 1
+    return out[:n]
+
+
+@njit(cache=True)
+def next_exit_index(high, swing_high):
+    """For every bar, return the first later bar where High reaches SwingHigh (-1 if none)."""
+    n = len(high)
+    next_hit = np.full(n, -1, dtype=np.int64)
+    nxt = -1
+    for k in range(n - 1, -1, -1):
+        next_hit[k] = nxt
+        if high[k] >= swing_high[k]:
+            nxt = k
+    return next_hit
+
+
+@njit(cache=True)
+def run_backtest(close, high, fib50, swing_high, starting_balance, risk_frac):
+    """Run the Fibonacci retracement strategy and return the trades as parallel arrays.
+
+    Returns (entry_idx, exit_idx, entry_px, exit_px, shares, pnl), one element per trade.
+    """
+    n = len(close)
+    entry_idx = np.empty(n, dtype=np.int64)
+    exit_idx = np.empty(n, dtype=np.int64)
+    entry_px = np.empty(n, dtype=np.float64)
+    exit_px = np.empty(n, dtype=np.float64)
+    shares = np.empty(n, dtype=np.float64)
+    pnl = np.empty(n, dtype=np.float64)
+
+    # Entry Signal: Close crosses above Fib50. Each condition is packed into uint64 bitmasks
+    # so conditions combine 64 bars per AND and empty stretches are skipped a word at a time.
+    above = np.zeros(n, dtype=np.bool_)
+    above[1:] = close[1:] > fib50[1:]
+    was_below = np.zeros(n, dtype=np.bool_)
+    was_below[1:] = close[:-1] <= fib50[1:]
+    entries = pack_mask(above) & pack_mask(was_below)
+
+    # Exit lookup table: first bar after each bar where High reaches SwingHigh
+    next_hit = next_exit_index(high, swing_high)
+
+    account_balance = starting_balance
+    n_trades = 0
+    for i in unpack_indices(entries):
+        # Exit Signal: Sell when reaching Swing High
+        j = next_hit[i]
+        if j == -1:
+            continue
+
+        # Position size is a fraction of the current account balance
+        position_shares = (risk_frac * account_balance) / close[i]
+        trade_pnl = (swing_high[j] - close[i]) * position_shares
+        account_balance += trade_pnl
+
+        entry_idx[n_trades] = i
+        exit_idx[n_trades] = j
+        entry_px[n_trades] = close[i]
+        exit_px[n_trades] = swing_high[j]
+        shares[n_trades] = position_shares
+        pnl[n_trades] = trade_pnl
+        n_trades += 1
+
+    return (
+        entry_idx[:n_trades],
+        exit_idx[:n_trades],
+        entry_px[:n_trades],
+        exit_px[:n_trades],
+        shares[:n_trades],
+        pnl[:n_trades],
+    )
+
+
+@njit(parallel=True, cache=True)
+def sweep_backtest(close, high, fib50, swing_high, swing_low, starting_balance, risk_frac):
+    """Run the backtest once per row of the (n_params, n_bars) indicator grids in parallel.
+
+    Bars with NaN indicators are dropped per row, as in the single run. Returns the ending balance per row.
+    """
+    n_params = fib50.shape[0]
+    ending_balance = np.empty(n_params, dtype=np.float64)
+    for p in prange(n_params):
+        valid = np.flatnonzero(np.isfinite(fib50[p]) & np.isfinite(swing_high[p]) & np.isfinite(swing_low[p]))
+        pnl = run_backtest(
+            close[valid], high[valid], fib50[p][valid], swing_high[p][valid], starting_balance, risk_frac
+        )[5]
+        ending_balance[p] = starting_balance + pnl.sum()
+    return ending_balance
+
+
+def download_prices(symbol, start, end):
+    """Download daily prices for one symbol from Yahoo Finance with Date as a regular column."""
+    # A flat, split/dividend-adjusted frame: no MultiIndex to flatten and no "Adj Close" to rename
+    data = yf.download(
+        symbol, start=start, end=end,
+        group_by="column", auto_adjust=True, multi_level_index=False, progress=False,
+    )
+
+    # Reset index to make Date a column, then keep every column as its own Arrow buffer
+    return data.reset_index().convert_dtypes(dtype_backend="pyarrow")
+
+
+def swing_levels(high, low, swing_length):
+    """Return float64 (swing_high, swing_low, fib50) arrays for one swing length."""
+    # Calculate Swing Highs and Lows
+    swing_high = centered_move(bn.move_max, high, swing_length)
+    swing_low = centered_move(bn.move_min, low, swing_length)
+
+    # Fibonacci Level Calculation (numexpr evaluates it in one pass without temporaries).
+    # Only Fib50 is read by the strategy, so the 38.2% and 61.8% levels are not computed.
+    fib50 = ne.evaluate("sh - (sh - sl) * 0.5", local_dict={"sh": swing_high, "sl": swing_low})
+    return swing_high, swing_low, fib50
+
+
+def add_indicators(prices, swing_length):
+    """Return a copy of a price frame with swing highs/lows and the Fib50 retracement level added."""
+    swing_high, swing_low, fib50 = swing_levels(
+        prices["High"].to_numpy(dtype=np.float64, na_value=np.nan),
+        prices["Low"].to_numpy(dtype=np.float64, na_value=np.nan),
+        swing_length,
+    )
+
+    # The Arrow-backed price columns are carried over as is; only the indicator columns are allocated
+    return prices.assign(SwingHigh=swing_high, SwingLow=swing_low, Fib50=fib50)
+
+
+def strategy_arrays(data):
+    """Extract the strategy columns for the rows whose indicators are all defined.
+
+    Returns (valid, close, high, fib50, swing_high, dates) where valid is the row mask over data.
+    """
+    close = data["Close"].to_numpy(dtype=np.float64, na_value=np.nan)
+    high = data["High"].to_numpy(dtype=np.float64, na_value=np.nan)
+    fib50 = data["Fib50"].to_numpy(dtype=np.float64)
+    swing_high = data["SwingHigh"].to_numpy(dtype=np.float64)
+    swing_low = data["SwingLow"].to_numpy(dtype=np.float64)
+    dates = data["Date"].to_numpy(dtype="datetime64[ns]")
+
+    # Drop rows with NaN values in Fib50, SwingHigh and SwingLow by masking the arrays
+    valid = np.isfinite(fib50) & np.isfinite(swing_high) & np.isfinite(swing_low)
+    return valid, close[valid], high[valid], fib50[valid], swing_high[valid], dates[valid]
+
+
+def build_transactions(dates, starting_balance, entry_idx, exit_idx, entry_px, exit_px, shares, pnl):
+    """Assemble the transactions table from the arrays returned by run_backtest."""
+    pnl_pct = (pnl / (entry_px * shares)) * 100
+
+    # Running totals; position sizing already compounds on the balance inside the kernel
+    total_pnl = np.cumsum(pnl)
+    return pd.DataFrame({
+        "Entry Date": dates[entry_idx],
+        "Exit Date": dates[exit_idx],
+        "Entry Price": entry_px,
+        "Exit Price": exit_px,
+        "Shares Bought": shares,
+        "Shares Sold": shares,
+        "P/L": pnl,
+        "P/L (%)": pnl_pct,
+        "Total P/L": total_pnl,
+        "Total P/L (%)": np.cumsum(pnl_pct),
+        "Account Balance": starting_balance + total_pnl,
+    })
+
+
+def sweep_swing_lengths(prices, swing_lengths, starting_balance, risk_percent):
+    """Backtest every swing length in one parallel pass and return the ending balances."""
+    close = prices["Close"].to_numpy(dtype=np.float64, na_value=np.nan)
+    high = prices["High"].to_numpy(dtype=np.float64, na_value=np.nan)
+    low = prices["Low"].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # One row per swing length so each parameter's indicators are contiguous. Levels are built
+    # by the same helper as the single run, so both paths feed the kernel identical inputs.
+    swing_high = np.empty((len(swing_lengths), len(prices)), dtype=np.float64)
+    swing_low = np.empty_like(swing_high)
+    fib50 = np.empty_like(swing_high)
+    for p, length in enumerate(swing_lengths):
+        swing_high[p], swing_low[p], fib50[p] = swing_levels(high, low, length)
+
+    return sweep_backtest(close, high, fib50, swing_high, swing_low, float(starting_balance), risk_percent / 100)
+
+
+def run_one(symbol, start, end, swing_length, starting_balance, risk_percent):
+    """Download, prepare and backtest a single symbol.
+
+    Returns (transactions, ending_balance); symbols without usable data yield no transactions.
+    """
+    prices = download_prices(symbol, start, end)
+    if prices.empty or any(col not in prices.columns for col in ["High", "Low", "Close"]):
+        return pd.DataFrame(), float(starting_balance)
+
+    _, close, high, fib50, swing_high, dates = strategy_arrays(add_indicators(prices, swing_length))
+    trades = run_backtest(close, high, fib50, swing_high, float(starting_balance), risk_percent / 100)
+    transactions = build_transactions(dates, starting_balance, *trades)
+    return transactions, float(starting_balance + trades[5].sum())